@@ -1,17 +1,48 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, inspect, make_url, text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import sessionmaker
 from pathlib import Path
-import os
+import asyncio, hashlib, logging, os, threading, uuid
+
+log = logging.getLogger(__name__)
 
 
 def _build_engine():
     url = (os.getenv("DATABASE_URL") or "").strip()
     if url:
-        # psycopg3 driver
+        # async driver (asyncpg)
         if url.startswith("postgres://"):
-            url = url.replace("postgres://", "postgresql+psycopg://")
+            url = url.replace("postgres://", "postgresql+asyncpg://", 1)
         elif url.startswith("postgresql://"):
-            url = url.replace("postgresql://", "postgresql+psycopg://")
-        return create_engine(url, pool_pre_ping=True)
+            url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+        elif url.startswith("postgresql+psycopg://"):
+            url = url.replace("postgresql+psycopg://", "postgresql+asyncpg://", 1)
+        # PgBouncer (transaction mode): ?pgbouncer=true or a pgbouncer host. The marker isn't
+        # a libpq/asyncpg option -> dropped from the URL. Pre-ping just piles up idle
+        # transactions there, and prepared statements don't survive switching server
+        # connections: no statement caches, unique statement names
+        u = make_url(url)
+        pgbouncer = u.query.get("pgbouncer", "").lower() in ("1", "true", "yes") or "pgbouncer" in (u.host or "")
+        u = u.difference_update_query(["pgbouncer"])
+        connect_args = {}
+        if pgbouncer:
+            u = u.update_query_dict({"prepared_statement_cache_size": "0"})
+            connect_args = {
+                "statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return create_async_engine(
+            u,
+            connect_args=connect_args,
+            pool_pre_ping=not pgbouncer,
+            pool_size=10,
+            max_overflow=20,
+            pool_recycle=1800,
+            pool_timeout=30,
+        )
 
     # Fallback: SQLite (Render Disk /data, jinak lokální soubor)
     data_dir = Path("/data")
@@ -20,17 +51,123 @@ def _build_engine():
     else:
         db_path = Path(__file__).resolve().parents[1] / "gpx_analyzer.db"
     db_path.parent.mkdir(parents=True, exist_ok=True)
-    return create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    # pooled connections keep their page cache warm; bounded, since cache_size
+    # is per connection and SQLite has a single writer anyway
+    eng = create_async_engine(f"sqlite+aiosqlite:///{db_path}", pool_size=8, max_overflow=4)
+    event.listen(eng.sync_engine, "connect", _sqlite_pragmas)
+    return eng
+
+
+# WAL: readers don't block on the upload writer; the rest trades fsyncs and
+# syscalls for memory (20MB page cache, 256MB mmap)
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
+
+
+# Globální engine: one lazily built pool per process (also under --reload / test imports)
+_engine: AsyncEngine | None = None
+_session_factory = None
+_lock = threading.Lock()
+
+
+def get_engine() -> AsyncEngine:
+    global _engine, _session_factory
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                eng = _build_engine()
+                _session_factory = sessionmaker(bind=eng, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+                _engine = eng
+    return _engine
+
 
+def new_session() -> AsyncSession:
+    get_engine()
+    return _session_factory()
 
-# Globální engine
-engine = _build_engine()
 
+def _migrate(conn):
+    # create_all neumí ALTER ani indexy existujících tabulek -> doplní nové nullable sloupce a indexy;
+    # returns the names of indexes existing rows kept from being created
+    insp = inspect(conn)
+    skipped = []
+    for table in SQLModel.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existing or not col.nullable:
+                continue
+            col_type = col.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}")
+        for idx in table.indexes:
+            try:
+                with conn.begin_nested():
+                    idx.create(conn, checkfirst=True)
+            except IntegrityError:
+                # e.g. duplicate horse names from before the unique index existed
+                log.warning("index %s not created: existing rows violate it", idx.name)
+                skipped.append(idx.name)
+    return skipped
 
-def init_db():
+
+def schema_hash() -> str:
+    # otisk modelů (tabulky, sloupce, indexy); change it -> init_db runs again
     from .models import Horse, Ride
-    SQLModel.metadata.create_all(engine)
+    tables = sorted(
+        (t.name, tuple((c.name, str(c.type), c.nullable) for c in t.columns),
+         tuple(sorted((i.name, i.unique) for i in t.indexes)))
+        for t in SQLModel.metadata.tables.values()
+    )
+    return hashlib.sha256(repr(tables).encode()).hexdigest()
+
+
+async def init_db():
+    from .models import Horse, Ride
+    async with get_engine().begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        skipped = await conn.run_sync(_migrate)
+        await conn.execute(text("CREATE TABLE IF NOT EXISTS _schema (v VARCHAR(64) PRIMARY KEY)"))
+        await conn.execute(text("DELETE FROM _schema"))
+        # schema incomplete -> no checksum, so the next `python -m app.db` / startup retries
+        if not skipped:
+            await conn.execute(text("INSERT INTO _schema (v) VALUES (:v)"), {"v": schema_hash()})
+
+
+async def check_db():
+    # startup check: one cheap round-trip comparing the stored schema checksum;
+    # schema setup runs once per deploy via `python -m app.db`, here only as a
+    # fallback for a fresh (local) database or one left behind by the models
+    async with get_engine().connect() as conn:
+        try:
+            current = (await conn.execute(text("SELECT v FROM _schema"))).scalar()
+        except DBAPIError:
+            current = None
+    if current != schema_hash():
+        await init_db()
+
+
+async def get_session():
+    async with new_session() as s:
+        yield s
+
+
+async def _main():
+    await init_db()
+    await get_engine().dispose()
 
 
-def get_session():
-    return Session(engine)
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,38 +1,73 @@
 
-from fastapi import FastAPI, UploadFile, Form, Request, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, StreamingResponse
+from fastapi import FastAPI, UploadFile, Form, Request, HTTPException, Depends
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, StreamingResponse, Response, ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+from anyio import to_thread
 from sqlmodel import select
-from sqlalchemy.orm import selectinload
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import delete, func, literal_column, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, defer
+from sqlalchemy.dialects import postgresql, sqlite
 from pathlib import Path
+from contextlib import asynccontextmanager
 from datetime import datetime, date
-import csv, io, uuid, zipfile, os
-
-# Optional imports for remote storage / HTTP fetches
-try:
-    import requests  # type: ignore
-except Exception:
-    requests = None  # we'll fallback to urllib
-import urllib.request
-
-try:
-    import boto3  # type: ignore
-    from botocore.config import Config  # type: ignore
-except Exception:
-    boto3 = None
-    Config = None
-
-from .db import init_db, get_session
+import asyncio, csv, io, uuid, zipfile, os, gzip, multiprocessing, time
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache, partial
+import httpx
+import numpy as np
+import orjson
+
+from .db import get_engine, check_db, get_session, new_session
 from .models import Horse, Ride
-from .metrics import parse_gpx_points, compute_metrics, hav_m
+from .metrics import analyze_gpx, minmax_indices, simplify_mask
+
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "64"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # uploads, R2 reads and backups hold threadpool slots while waiting on disk/network
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    await check_db()
+    yield
+    await HTTP.aclose()
+    if gpx_pool.cache_info().currsize:
+        gpx_pool().shutdown(cancel_futures=True)
+    await get_engine().dispose()
 
 # ---------------- Persistent storage paths ----------------
-app = FastAPI(title="GPX Analyzer – Horse Dashboard")
+app = FastAPI(title="GPX Analyzer – Horse Dashboard", lifespan=lifespan, default_response_class=ORJSONResponse)
+class SkipGZip(GZipMiddleware):
+    # GZipMiddleware minus routes whose body is already compressed (backup.zip)
+    def __init__(self, app, skip_paths=(), **kwargs):
+        super().__init__(app, **kwargs)
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+# ride detail pages embed tens of KB of JSON series
+app.add_middleware(SkipGZip, skip_paths=("/backup.zip",), minimum_size=1024, compresslevel=5)
 BASE_DIR = Path(__file__).resolve().parents[1]
 DATA_DIR = (Path("/data/gpx") if Path("/data").exists() else BASE_DIR / "data" / "gpx")
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# shared keep-alive pool for http(s) GPX refs
+HTTP = httpx.AsyncClient(
+    http2=True,
+    follow_redirects=True,   # as the old urllib code did; httpx doesn't by default
+    timeout=20.0,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+)
+
 # --------------- Optional Cloudflare R2 config --------------
 R2_ACCOUNT_ID = os.getenv("R2_ACCOUNT_ID")
 R2_ACCESS_KEY_ID = os.getenv("R2_ACCESS_KEY_ID")
@@ -40,10 +75,16 @@ R2_SECRET_ACCESS_KEY = os.getenv("R2_SECRET_ACCESS_KEY")
 R2_BUCKET = os.getenv("R2_BUCKET")
 R2_PUBLIC_BASEURL = os.getenv("R2_PUBLIC_BASEURL")
 
+# boto3 clients are thread-safe and expensive to build -> one per process;
+# boto3 itself is optional and slow to import, so only pulled in when R2 is configured
+@lru_cache(maxsize=1)
 def r2_client():
     if not (R2_ACCOUNT_ID and R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY and R2_BUCKET):
         return None
-    if boto3 is None or Config is None:
+    try:
+        import boto3  # type: ignore
+        from botocore.config import Config  # type: ignore
+    except Exception:
         return None
     return boto3.client(
         "s3",
@@ -54,45 +95,347 @@ def r2_client():
         region_name="auto",
     )
 
-# ------------------- Static/Template mounts ----------------
-app.mount("/static", StaticFiles(directory=str((Path(__file__).parent / "static").resolve())), name="static")
-templates = Jinja2Templates(directory=str((Path(__file__).parent / "templates").resolve()))
+# multipart upload in 8MB parts, streamed from the spooled UploadFile
+@lru_cache(maxsize=1)
+def r2_transfer():
+    from boto3.s3.transfer import TransferConfig  # type: ignore
+    return TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024,
+        max_concurrency=8,
+        use_threads=True,
+    )
+
+# presigned download URLs are reused until shortly before they expire;
+# insertion order = expiry order (same TTL), so the oldest entries go first
+PRESIGN_TTL = 600
+PRESIGN_CACHE_MAX = 512
+_presign_cache: OrderedDict[tuple[str, str], tuple[str, float]] = OrderedDict()
+
+def presigned_get_url(r2, bkt: str, key: str) -> str:
+    now = time.monotonic()
+    hit = _presign_cache.get((bkt, key))
+    if hit and now < hit[1]:
+        return hit[0]
+    url = r2.generate_presigned_url("get_object", Params={"Bucket": bkt, "Key": key}, ExpiresIn=PRESIGN_TTL)
+    _presign_cache.pop((bkt, key), None)
+    _presign_cache[(bkt, key)] = (url, now + PRESIGN_TTL - 60)
+    while _presign_cache and (len(_presign_cache) > PRESIGN_CACHE_MAX or next(iter(_presign_cache.values()))[1] <= now):
+        _presign_cache.popitem(last=False)
+    return url
 
-@app.on_event("startup")
-def on_startup():
-    init_db()
+# ------------------- Static/Template mounts ----------------
+APP_DIR = Path(__file__).resolve().parent
+app.mount("/static", StaticFiles(directory=str(APP_DIR / "static")), name="static")
+templates = Jinja2Templates(directory=str(APP_DIR / "templates"))
+# compiled templates stay cached; without this Jinja stats every template file on each
+# render. Templates ship with the code, TEMPLATES_RELOAD=1 for editing them live
+templates.env.auto_reload = os.getenv("TEMPLATES_RELOAD", "").lower() in ("1", "true", "yes")
 
 # ---------------------- Helpers ----------------------------
-def accum_periods(rides):
-    monthly, weekly, yearly = {}, {}, {}
-    for r in rides:
-        ym = r.ride_date.strftime("%Y-%m")
-        iso = r.ride_date.isocalendar()
-        yw = f"{iso[0]}-W{iso[1]:02d}"
-        yy = r.ride_date.strftime("%Y")
-        for bucket, key in ((monthly, ym),(weekly, yw),(yearly, yy)):
-            d = bucket.setdefault(key, {"km":0.0,"rides":0,"avg_sum":0.0})
-            d["km"] += r.distance_km; d["rides"] += 1; d["avg_sum"] += r.avg_speed_kmh
-    def rows(bucket):
-        return [{"period":k,"rides":v["rides"],"km":round(v["km"],2),"avg_kmh":round(v["avg_sum"]/v["rides"],2)} for k,v in sorted(bucket.items(), reverse=True)]
-    return rows(monthly), rows(weekly), rows(yearly)
+PERIODS = ("monthly", "weekly", "yearly")
+
+# period keys "YYYY-MM", ISO "YYYY-Www", "YYYY" as SQL expressions
+def period_exprs(dialect: str):
+    d = Ride.ride_date
+    if dialect == "postgresql":
+        return func.to_char(d, "YYYY-MM"), func.to_char(d, 'IYYY-"W"IW'), func.to_char(d, "YYYY")
+    # SQLite: ISO week/year taken from the Thursday of the same week
+    thu = func.date(d, "-3 days", "weekday 4")
+    week_no = func.printf("%02d", (func.strftime("%j", thu) - 1) / 7 + 1)
+    week = func.strftime("%Y", thu).concat("-W").concat(week_no)
+    return func.strftime("%Y-%m", d), week, func.strftime("%Y", d)
+
+async def period_rows(s, horse_id: int | None = None):
+    stmts = []
+    for kind, expr in zip(PERIODS, period_exprs(get_engine().dialect.name)):
+        q = (
+            select(
+                literal_column(f"'{kind}'").label("kind"),
+                expr.label("period"),
+                func.count(Ride.id).label("rides"),
+                func.sum(Ride.distance_km).label("km"),
+                func.avg(Ride.avg_speed_kmh).label("avg_kmh"),
+            )
+            .group_by(expr)
+        )
+        if horse_id is not None:
+            q = q.where(Ride.horse_id == horse_id)
+        stmts.append(q)
+    stmt = union_all(*stmts).order_by(literal_column("kind"), literal_column("period").desc())
+    out = {kind: [] for kind in PERIODS}
+    for kind, period, rides, km, avg_kmh in (await s.exec(stmt)).all():
+        out[kind].append({"period": period, "rides": rides, "km": round(km, 2), "avg_kmh": round(avg_kmh, 2)})
+    return out["monthly"], out["weekly"], out["yearly"]
+
+# period summaries per horse, per process; they only change when rides are added,
+# deleted or unassigned -> those endpoints call rides_changed()
+_periods: dict[int | None, tuple] = {}
+_rides_version = 0
+
+def rides_changed():
+    global _rides_version
+    _rides_version += 1; _periods.clear()
+
+async def cached_period_rows(s, horse_id: int | None = None):
+    if horse_id in _periods:
+        return _periods[horse_id]
+    version = _rides_version
+    rows = await period_rows(s, horse_id)
+    # a write that landed during the query makes this result stale: don't keep it
+    if version == _rides_version:
+        _periods[horse_id] = rows
+    return rows
+
+# precomputed series for ride detail (stored gzipped on Ride.metrics_json),
+# kept as parallel arrays; bump the version when the layout changes and
+# older blobs get rebuilt from the GPX
+ARTIFACTS_VERSION = 4
+
+def ride_artifacts(metrics) -> dict:
+    # float32 columns of the (N, 3) coords, made contiguous for orjson
+    lat, lon, ele = np.ascontiguousarray(metrics.coords.T)
+    return {
+        "version": ARTIFACTS_VERSION,
+        # numpy arrays, serialized as-is by orjson (NaN -> null); t is epoch ms
+        "speed": {"t": metrics.speed_t*1000.0, "v": metrics.speed_v*np.float32(3.6)},
+        "elev": {"d": metrics.elev_d/np.float32(1000.0), "e": metrics.elev_e},
+        "lat": lat, "lon": lon, "ele": ele,
+    }
+
+def pack_artifacts(artifacts: dict) -> bytes:
+    return gzip.compress(orjson.dumps(artifacts, option=orjson.OPT_SERIALIZE_NUMPY))
+
+def unpack_artifacts(blob: bytes) -> dict | None:
+    artifacts = orjson.loads(gzip.decompress(blob))
+    return artifacts if artifacts.get("version") == ARTIFACTS_VERSION else None
+
+GAIT_COLORS = ("#00a000", "#0000ff", "#ff0000")   # krok / klus / cval
+
+# v_kmh[i] is the speed between point i and point i+1
+def gait_codes(v_kmh, walk_thr: float, trot_thr: float):
+    # 0 = walk, 1 = trot, 2 = canter per segment
+    # same precedence as if v < walk / elif v < trot, also when walk_thr > trot_thr
+    v = np.asarray(v_kmh, dtype=np.float64)
+    return np.where(v < walk_thr, 0, np.where(v < trot_thr, 1, 2)).astype(np.int8)
+
+def build_segments(v_kmh, walk_thr: float, trot_thr: float):
+    # runs of one colour as point index ranges [from, to] (indices of the full track)
+    codes = gait_codes(v_kmh, walk_thr, trot_thr)
+    if not len(codes):
+        return []
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1))
+    ends = np.append(starts[1:], len(codes))
+    return [{"color": GAIT_COLORS[c], "from": a, "to": b}
+            for c, a, b in zip(codes[starts].tolist(), starts.tolist(), ends.tolist())]
+
+def horse_thresholds(horse) -> list[float]:
+    walk_thr = horse.walk_trot_kmh if horse and horse.walk_trot_kmh is not None else 7.0
+    trot_thr = horse.trot_canter_kmh if horse and horse.trot_canter_kmh is not None else 13.0
+    return [walk_thr, trot_thr]
+
+def add_gait(artifacts: dict, thr: list[float]) -> dict:
+    # segments for the thresholds in effect at upload; ride_detail reuses them while they still match
+    artifacts["gait"] = {"thr": thr, "segments": build_segments(artifacts["speed"]["v"], *thr)}
+    return artifacts
+
+# in-flight GPX backfills per ride: the detail page and its coords.bin (or two
+# tabs) hitting a cold ride share one parse instead of each doing their own
+_backfills: dict[int, asyncio.Future] = {}
+
+async def load_artifacts(s: AsyncSession, ride: Ride) -> dict | None:
+    # gunzip + JSON decode of a long ride is a few ms of CPU, keep it off the loop
+    artifacts = await run_in_threadpool(unpack_artifacts, ride.metrics_json) if ride.metrics_json else None
+    if artifacts is None:
+        fut = _backfills.get(ride.id)
+        if fut is None:
+            fut = _backfills[ride.id] = asyncio.ensure_future(load_gpx_metrics(ride.gpx_path))
+            fut.add_done_callback(lambda _, rid=ride.id: _backfills.pop(rid, None))
+        metrics = await asyncio.shield(fut)
+        if metrics and len(metrics.coords):
+            artifacts = ride_artifacts(metrics)
+            # rides uploaded before the cache existed get it filled on first view
+            ride.metrics_json = await run_in_threadpool(pack_artifacts, artifacts)
+            s.add(ride); await s.commit()
+    return artifacts
+
+# id of the horse with this name, inserted if missing; INSERT .. ON CONFLICT DO
+# NOTHING keeps concurrent uploads from racing on the same new name
+async def horse_id_for(s, name: str) -> int:
+    by_name = select(Horse.id).where(Horse.name == name)
+    hid = (await s.exec(by_name)).first()
+    if hid is None:
+        insert = postgresql.insert if get_engine().dialect.name == "postgresql" else sqlite.insert
+        stmt = insert(Horse).values(name=name).on_conflict_do_nothing().returning(Horse.id)
+        hid = (await s.exec(stmt)).scalar()
+        if hid is None:
+            hid = (await s.exec(by_name)).one()
+    return hid
+
+# ZipFile target that just collects written bytes; it cannot seek, so zipfile
+# streams entries with data descriptors and the generator drains it as it goes
+class ZipChunks(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+async def backup_chunks(batch: int = 1000):
+    sink, buf = ZipChunks(), io.StringIO()
+    w = csv.writer(buf)
+
+    def flush(entry):
+        entry.write(buf.getvalue().encode("utf-8"))
+        buf.seek(0); buf.truncate()
+
+    # level 1: most of the size win on CSV/GPX text for a fraction of the CPU
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        # own session (the response body is produced after the handler returned), closed
+        # once the CSVs are written: a pooled connection isn't held while GPX files stream
+        async with new_session() as s:
+            with z.open("horses.csv", "w") as entry:
+                w.writerow(["id","name","walk_trot_kmh","trot_canter_kmh","notes"])
+                # plain column rows straight to csv, no ORM objects
+                result = await s.stream(
+                    select(Horse.id, Horse.name, Horse.walk_trot_kmh, Horse.trot_canter_kmh, Horse.notes)
+                    .order_by(Horse.id).execution_options(yield_per=batch)
+                )
+                async for horses in result.partitions():
+                    w.writerows((hid, name, walk or "", trot or "", notes or "") for hid, name, walk, trot, notes in horses)
+                    flush(entry)
+                    yield sink.take()
+                flush(entry)
+            with z.open("rides.csv", "w") as entry:
+                w.writerow(["id","date","title","horse_id","distance_km","avg_speed_kmh","max_speed_kmh","ascent_m","descent_m","gpx_path"])
+                local_gpx = []
+                result = await s.stream(
+                    select(Ride.id, Ride.ride_date, Ride.title, Ride.horse_id, Ride.distance_km, Ride.avg_speed_kmh,
+                           Ride.max_speed_kmh, Ride.ascent_m, Ride.descent_m, Ride.gpx_path)
+                    .order_by(Ride.id).execution_options(yield_per=batch)
+                )
+                async for rides in result.partitions():
+                    for rid, rdate, title, horse_id, km, avg, vmax, asc, desc, gpx_path in rides:
+                        w.writerow([rid, rdate.isoformat(), title or "", horse_id or "", km, avg, vmax, asc, desc, gpx_path])
+                        if not gpx_path.startswith(("s3://", "http")):
+                            local_gpx.append((rid, Path(gpx_path)))
+                    flush(entry)
+                    yield sink.take()
+                flush(entry)
+        # GPX files on local disk (gone after a redeploy otherwise), 1MB at a time;
+        # read + deflate in the threadpool so the loop isn't stuck compressing
+        for rid, p in local_gpx:
+            if not p.exists():
+                continue
+            with z.open(f"gpx/{rid}.gpx", "w") as entry, (gzip.open if p.suffix == ".gz" else open)(p, "rb") as f:
+                while chunk := await run_in_threadpool(f.read, 1 << 20):
+                    await run_in_threadpool(entry.write, chunk)
+                    yield sink.take()
+    yield sink.take()
+
+# GPX parsing + metrics is pure CPU -> separate processes, so uploads and
+# cache backfills neither block the event loop nor fight over the GIL
+GPX_POOL_WORKERS = int(os.getenv("GPX_POOL_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+@lru_cache(maxsize=1)
+def gpx_pool() -> ProcessPoolExecutor:
+    # built lazily inside the running server: no fork of a multithreaded process that
+    # would also inherit the listening socket and DB fds; workers only import app.metrics
+    return ProcessPoolExecutor(max_workers=GPX_POOL_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+
+async def analyze_in_pool(source):
+    return await asyncio.get_running_loop().run_in_executor(gpx_pool(), analyze_gpx, source)
+
+# R2 object -> dest (False = R2 not configured); blocking, run it in the threadpool
+def download_r2_gpx(gpx_path: str, dest: Path) -> bool:
+    r2 = r2_client()
+    if not r2:
+        return False
+    _, _, bucket_key = gpx_path.partition("s3://")
+    bkt, _, key = bucket_key.partition("/")
+    r2.download_file(bkt, key, str(dest), Config=r2_transfer())
+    return True
+
+async def download_http_gpx(url: str, dest: Path) -> bool:
+    try:
+        async with HTTP.stream("GET", url) as resp:
+            if not resp.is_success:
+                return False
+            await save_stream(resp.aiter_bytes(1 << 20), dest)
+    except httpx.HTTPError:
+        return False
+    return True
+
+# metrics from the stored GPX no matter if local, R2 or URL; None when it's gone
+async def load_gpx_metrics(gpx_path: str):
+    if gpx_path.startswith(("http", "s3://")):
+        # remote bodies are spooled to a temporary file like R2 uploads: the pool worker
+        # streams it from disk, no whole GPX in memory here or pickled over to the pool
+        dest = DATA_DIR / f"{uuid.uuid4().hex}.part"
+        try:
+            if gpx_path.startswith("http"):
+                ok = await download_http_gpx(gpx_path, dest)
+            else:
+                ok = await run_in_threadpool(download_r2_gpx, gpx_path, dest)
+            return await analyze_in_pool(dest) if ok else None
+        finally:
+            await run_in_threadpool(dest.unlink, missing_ok=True)
+    p = Path(gpx_path)
+    return await analyze_in_pool(p) if p.exists() else None
 
 # ---------------------- Routes -----------------------------
+INDEX_PAGE_SIZE = 100
+
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request):
-    with get_session() as s:
-        horses = s.exec(select(Horse).order_by(Horse.name)).all()
-        rides = s.exec(
-            select(Ride)
-            .options(selectinload(Ride.horse))
-            .order_by(Ride.ride_date.desc(), Ride.id.desc())
-        ).all()
-        monthly_rows, weekly_rows, yearly_rows = accum_periods(rides)
+async def index(request: Request, page: int = 0, s: AsyncSession = Depends(get_session)):
+    horses = (await s.exec(select(Horse).order_by(Horse.name))).all()
+    # souhrn přes všechny jízdy in one aggregate; the table below is one page of plain rows
+    count, km, avg = (await s.exec(
+        select(func.count(Ride.id), func.coalesce(func.sum(Ride.distance_km), 0),
+               func.coalesce(func.avg(Ride.avg_speed_kmh), 0))
+    )).one()
+    page = max(page, 0)
+    rides = (await s.exec(
+        select(Ride.id, Ride.ride_date, Ride.title, Horse.name.label("horse_name"),
+               Ride.distance_km, Ride.avg_speed_kmh, Ride.max_speed_kmh)
+        .outerjoin(Horse, Ride.horse_id == Horse.id)
+        .order_by(Ride.ride_date.desc(), Ride.id.desc())
+        .limit(INDEX_PAGE_SIZE).offset(page*INDEX_PAGE_SIZE)
+    )).all()
+    # period summaries live on the horse pages (SQL GROUP BY, period_rows); index.html shows none
     return templates.TemplateResponse("index.html", {
         "request": request, "horses": horses, "rides": rides,
-        "monthly": monthly_rows, "weekly": weekly_rows, "yearly": yearly_rows
+        "summary": {"count": count, "km": km, "avg": avg},
+        "page": page, "has_next": (page+1)*INDEX_PAGE_SIZE < count,
     })
 
+gzip_writer = partial(gzip.open, compresslevel=6)
+
+async def save_stream(chunks, dest: Path, opener=open):
+    # async iterable of bytes -> dest; disk writes in the threadpool, a slow /data volume must not stall the loop
+    out = await run_in_threadpool(opener, dest, "wb")
+    try:
+        async for chunk in chunks:
+            await run_in_threadpool(out.write, chunk)
+    finally:
+        await run_in_threadpool(out.close)
+
+async def save_upload(file: UploadFile, dest: Path, opener=open):
+    # 1MB at a time
+    async def chunks():
+        while chunk := await file.read(1 << 20):
+            yield chunk
+    await save_stream(chunks(), dest, opener)
+
 @app.post("/upload", response_class=HTMLResponse)
 async def upload_gpx(
     request: Request,
@@ -100,261 +443,310 @@ async def upload_gpx(
     horse_name: str = Form(default=""),
     ride_title: str = Form(default=""),
     ride_date: str = Form(default=""),
+    s: AsyncSession = Depends(get_session),
 ):
-    contents = await file.read()
     uid = uuid.uuid4().hex
 
-    # store either to R2 (if configured) or local disk (/data)
+    # store either to R2 (if configured) or local disk (/data), streamed in chunks
     r2 = r2_client()
     if r2:
         key = f"{uid}.gpx"
-        r2.put_object(Bucket=R2_BUCKET, Key=key, Body=contents, ContentType="application/gpx+xml")
+        await run_in_threadpool(
+            r2.upload_fileobj, file.file, R2_BUCKET, key,
+            ExtraArgs={"ContentType": "application/gpx+xml"}, Config=r2_transfer(),
+        )
         gpx_ref = f"{R2_PUBLIC_BASEURL}/{key}" if R2_PUBLIC_BASEURL else f"s3://{R2_BUCKET}/{key}"
     else:
-        dest = DATA_DIR / f"{uid}.gpx"
-        dest.write_bytes(contents)
+        # gzipped at rest (XML shrinks ~5-10x): less disk I/O, and /gpx sends it as-is
+        dest = DATA_DIR / f"{uid}.gpx.gz"
+        await save_upload(file, dest, gzip_writer)
         gpx_ref = str(dest)
 
-    # compute metrics to fill ride fields
-    pts = parse_gpx_points(contents.decode("utf-8", errors="ignore"))
-    metrics = compute_metrics(pts)
-
-    with get_session() as s:
-        horse = None
-        if horse_name.strip():
-            horse = s.exec(select(Horse).where(Horse.name == horse_name.strip())).first()
-            if not horse:
-                horse = Horse(name=horse_name.strip())
-                s.add(horse); s.commit(); s.refresh(horse)
-
-        rd = date.fromisoformat(ride_date.strip()) if ride_date.strip() else (metrics.start_time or datetime.utcnow()).date()
-
-        r = Ride(
-            title=ride_title.strip() or file.filename,
-            ride_date=rd,
-            distance_km=round(metrics.distance_m/1000.0, 3),
-            total_time_s=metrics.total_time_s,
-            moving_time_s=metrics.moving_time_s,
-            avg_speed_kmh=round(metrics.avg_speed_mps*3.6, 2),
-            # convert moving speed from m/s to km/h
-            avg_moving_speed_kmh=round(metrics.avg_moving_speed_mps*3.6, 2),
-            max_speed_kmh=round(metrics.max_speed_mps*3.6, 2),
-            ascent_m=round(metrics.ascent_m, 1),
-            descent_m=round(metrics.descent_m, 1),
-            min_elev_m=metrics.min_elev_m,
-            max_elev_m=metrics.max_elev_m,
-            gpx_path=gpx_ref,
-            horse_id=horse.id if horse else None
-        )
-        s.add(r); s.commit(); s.refresh(r)
-        return RedirectResponse(url=f"/ride/{r.id}", status_code=303)
-
-@app.get("/ride/{ride_id}", response_class=HTMLResponse)
-def ride_detail(request: Request, ride_id: int):
-    with get_session() as s:
-        ride = s.exec(
-            select(Ride).options(selectinload(Ride.horse)).where(Ride.id == ride_id)
-        ).first()
-        if not ride:
-            return HTMLResponse("Ride not found", status_code=404)
-
-    # load GPX text no matter if local or URL
-    p = Path(ride.gpx_path)
-    missing_gpx, text = False, None
-    if ride.gpx_path.startswith("http"):
-        if requests is not None:
-            resp = requests.get(ride.gpx_path, timeout=20)
-            if resp.ok: text = resp.text
-            else: missing_gpx = True
-        else:
-            try:
-                with urllib.request.urlopen(ride.gpx_path, timeout=20) as f:
-                    text = f.read().decode("utf-8", errors="ignore")
-            except Exception:
-                missing_gpx = True
-    elif ride.gpx_path.startswith("s3://"):
-        r2 = r2_client()
-        if r2:
-            _, _, bucket_key = ride.gpx_path.partition("s3://")
-            bkt, _, key = bucket_key.partition("/")
-            obj = r2.get_object(Bucket=bkt, Key=key)
-            text = obj["Body"].read().decode("utf-8", errors="ignore")
-        else:
-            missing_gpx = True
+    # compute metrics to fill ride fields (in the process pool, off the event loop);
+    # the worker streams the file from disk, R2 uploads via a temporary local copy
+    if r2:
+        dest = DATA_DIR / f"{uid}.part"
+        await file.seek(0)
+        await save_upload(file, dest)
+        try:
+            metrics = await analyze_in_pool(dest)
+        finally:
+            await run_in_threadpool(dest.unlink, missing_ok=True)
     else:
-        if p.exists():
-            text = p.read_text(encoding="utf-8", errors="ignore")
-        else:
-            missing_gpx = True
-
-    speed_ts, elev_profile, segments = [], [], []
-    if not missing_gpx and text:
-        pts = parse_gpx_points(text)
-        metrics = compute_metrics(pts)
-        speed_ts = [{"t": (t.isoformat() if t else None), "v": v*3.6} for t, v in metrics.speed_series]
-        elev_profile = [{"d": d/1000.0, "e": e} for d, e in metrics.elev_profile]
-
-        walk_thr = ride.horse.walk_trot_kmh if ride.horse and ride.horse.walk_trot_kmh is not None else 7.0
-        trot_thr = ride.horse.trot_canter_kmh if ride.horse and ride.horse.trot_canter_kmh is not None else 13.0
-
-        def color_for(v_kmh: float) -> str:
-            if v_kmh < walk_thr:
-                return "#00a000"
-            if v_kmh < trot_thr:
-                return "#0000ff"
-            return "#ff0000"
-
-        for i in range(1, len(pts)):
-            t1, lat1, lon1, _ = pts[i-1]
-            t2, lat2, lon2, _ = pts[i]
-            dt = (t2 - t1).total_seconds() if (t1 and t2) else 1.0
-            if dt <= 0:
-                dt = 1.0
-            d = hav_m(lat1, lon1, lat2, lon2)
-            v_kmh = (d / dt) * 3.6
-            color = color_for(v_kmh)
-            if not segments or segments[-1]["color"] != color:
-                segments.append({"color": color, "coords": [[lat1, lon1], [lat2, lon2]]})
-            else:
-                segments[-1]["coords"].append([lat2, lon2])
+        metrics = await analyze_in_pool(dest)
+
+    horse_id = await horse_id_for(s, horse_name.strip()) if horse_name.strip() else None
+    horse = await s.get(Horse, horse_id) if horse_id else None
+
+    rd = date.fromisoformat(ride_date.strip()) if ride_date.strip() else (metrics.start_time or datetime.utcnow()).date()
+
+    r = Ride(
+        title=ride_title.strip() or file.filename,
+        ride_date=rd,
+        distance_km=round(metrics.distance_m/1000.0, 3),
+        total_time_s=metrics.total_time_s,
+        moving_time_s=metrics.moving_time_s,
+        avg_speed_kmh=round(metrics.avg_speed_mps*3.6, 2),
+        # convert moving speed from m/s to km/h
+        avg_moving_speed_kmh=round(metrics.avg_moving_speed_mps*3.6, 2),
+        max_speed_kmh=round(metrics.max_speed_mps*3.6, 2),
+        ascent_m=round(metrics.ascent_m, 1),
+        descent_m=round(metrics.descent_m, 1),
+        min_elev_m=metrics.min_elev_m,
+        max_elev_m=metrics.max_elev_m,
+        gpx_path=gpx_ref,
+        metrics_json=await run_in_threadpool(pack_artifacts, add_gait(ride_artifacts(metrics), horse_thresholds(horse))),
+        horse_id=horse_id
+    )
+    s.add(r); await s.commit(); await s.refresh(r)
+    rides_changed()
+    return RedirectResponse(url=f"/ride/{r.id}", status_code=303)
+
+# rendered ride pages per process, LRU within a byte budget; a ride isn't edited
+# after upload, so the page only changes with its horse (link, name, thresholds)
+RIDE_HTML_CACHE_BYTES = 32 * 1024 * 1024
+_ride_html: OrderedDict[tuple, bytes] = OrderedDict()
+_ride_html_size = 0
+
+def cache_ride_html(key: tuple, body: bytes):
+    global _ride_html_size
+    if key in _ride_html or len(body) > RIDE_HTML_CACHE_BYTES // 8:
+        return
+    _ride_html[key] = body; _ride_html_size += len(body)
+    while _ride_html_size > RIDE_HTML_CACHE_BYTES:
+        _ride_html_size -= len(_ride_html.popitem(last=False)[1])
 
-    return templates.TemplateResponse(
+@app.get("/ride/{ride_id}", response_class=HTMLResponse)
+async def ride_detail(request: Request, ride_id: int, s: AsyncSession = Depends(get_session)):
+    ride = (await s.exec(
+        # one row: LEFT JOIN the horse in the same query instead of a second SELECT
+        select(Ride).options(joinedload(Ride.horse), defer(Ride.metrics_json)).where(Ride.id == ride_id)
+    )).first()
+    if not ride:
+        return HTMLResponse("Ride not found", status_code=404)
+
+    key = (ride.id, ride.created_at, ride.horse_id, ride.horse.name if ride.horse else None, *horse_thresholds(ride.horse))
+    if (body := _ride_html.get(key)) is not None:
+        _ride_html.move_to_end(key)
+        return HTMLResponse(body)
+
+    await s.refresh(ride, ["metrics_json"])   # the blob is only needed on a cache miss
+    artifacts = await load_artifacts(s, ride)
+    missing_gpx = artifacts is None
+
+    speed, elev, segments = {"t": [], "v": []}, {"d": [], "e": []}, []
+    if artifacts:
+        speed, elev = artifacts["speed"], artifacts["elev"]
+
+        thr = horse_thresholds(ride.horse); gait = artifacts.get("gait")
+        # recomputed only when the horse's thresholds changed since upload (or are inverted:
+        # segments stored before gait_codes kept the walk-first precedence for that case)
+        cached = gait and gait["thr"] == thr and thr[0] <= thr[1]
+        segments = gait["segments"] if cached else build_segments(speed["v"], *thr)
+        # the charts get a decimated copy, the map segments above use the full series
+        speed, elev = chart_series(speed, "t", "v"), chart_series(elev, "d", "e")
+
+    # serialized once with orjson, embedded as-is in the page script; the track
+    # itself comes from coords.bin (created_at in the URL so a reused id never hits a stale cache)
+    resp = templates.TemplateResponse(
         "ride_detail.html",
-        {"request": request, "ride": ride, "horse": ride.horse, "speed_ts": speed_ts,
-         "elev_profile": elev_profile, "segments": segments, "missing_gpx": missing_gpx}
+        {"request": request, "ride": ride, "horse": ride.horse,
+         "speed_json": orjson.dumps(speed, option=orjson.OPT_SERIALIZE_NUMPY).decode(),
+         "elev_json": orjson.dumps(elev, option=orjson.OPT_SERIALIZE_NUMPY).decode(),
+         "segments_json": orjson.dumps(segments).decode(), "missing_gpx": missing_gpx,
+         "coords_url": f"/ride/{ride.id}/coords.bin?v={ARTIFACTS_VERSION}.{COORDS_BIN_FORMAT}.{int(ride.created_at.timestamp())}"}
     )
+    if not missing_gpx:
+        cache_ride_html(key, resp.body)
+    return resp
+
+# points per chart series; a few thousand is past what a chart's width can show
+CHART_POINTS = 2000
+
+def chart_series(series: dict, x: str, y: str) -> dict:
+    # None (NaN in the blob) -> nan -> null again in the JSON
+    xs, ys = np.asarray(series[x], dtype=np.float64), np.asarray(series[y], dtype=np.float64)
+    idx = minmax_indices(ys, CHART_POINTS // 2)
+    return {x: xs[idx], y: ys[idx]}
+
+# layout of coords.bin, part of its cache key: 2 = simplified (lat, lon, ele, index) float32 rows
+COORDS_BIN_FORMAT = 2
+
+@app.get("/ride/{ride_id}/coords.bin")
+async def ride_coords(ride_id: int, s: AsyncSession = Depends(get_session)):
+    ride = await s.get(Ride, ride_id)
+    artifacts = await load_artifacts(s, ride) if ride else None
+    if not artifacts:
+        raise HTTPException(404, "Track not available")
+    return Response(await run_in_threadpool(coords_blob, artifacts), media_type="application/octet-stream",
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+def coords_blob(artifacts: dict) -> bytes:
+    # the map can't show sub-5m detail: RDP-simplified points, each with its index in the
+    # full track (exact in float32 up to 16M points) so the gait segments still line up;
+    # little-endian float32 rows -> new Float32Array(buf) in the browser
+    lat, lon, ele = (np.asarray(artifacts[k], dtype=np.float64) for k in ("lat", "lon", "ele"))
+    idx = np.flatnonzero(simplify_mask(lat, lon))
+    return np.column_stack((lat[idx], lon[idx], ele[idx], idx)).astype("<f4").tobytes()
 
 @app.post("/ride/{ride_id}/delete")
-def delete_ride(ride_id: int):
-    with get_session() as s:
-        ride = s.get(Ride, ride_id)
-        if not ride:
-            raise HTTPException(status_code=404, detail="Jízda nenalezena")
-        # try delete local file
-        try:
-            if ride.gpx_path and ride.gpx_path.startswith("/"):
-                p = Path(ride.gpx_path)
-                if p.exists(): p.unlink()
-        except Exception:
-            pass
-        s.delete(ride); s.commit()
+async def delete_ride(ride_id: int, s: AsyncSession = Depends(get_session)):
+    ride = await s.get(Ride, ride_id)
+    if not ride:
+        raise HTTPException(status_code=404, detail="Jízda nenalezena")
+    # try delete local file
+    try:
+        if ride.gpx_path and ride.gpx_path.startswith("/"):
+            p = Path(ride.gpx_path)
+            if p.exists(): p.unlink()
+    except Exception:
+        pass
+    await s.delete(ride); await s.commit()
+    rides_changed()
     return RedirectResponse("/", status_code=303)
 
 @app.get("/gpx/{ride_id}")
-def download_gpx(ride_id: int):
-    with get_session() as s:
-        ride = s.get(Ride, ride_id)
-        if not ride:
-            return HTMLResponse("Ride not found", status_code=404)
-
-        if ride.gpx_path.startswith("http"):
-            return RedirectResponse(ride.gpx_path)
-        if ride.gpx_path.startswith("s3://"):
-            r2 = r2_client()
-            if not r2: return HTMLResponse("Storage not configured", status_code=500)
-            _, _, bucket_key = ride.gpx_path.partition("s3://")
-            bkt, _, key = bucket_key.partition("/")
-            url = r2.generate_presigned_url("get_object", Params={"Bucket": bkt, "Key": key}, ExpiresIn=600)
-            return RedirectResponse(url)
-
-        p = Path(ride.gpx_path)
-        if not p.exists():
-            return HTMLResponse("GPX soubor už není k dispozici.", status_code=404)
-        return FileResponse(path=str(p), filename=p.name, media_type="application/gpx+xml")
+async def download_gpx(request: Request, ride_id: int, s: AsyncSession = Depends(get_session)):
+    ride = await s.get(Ride, ride_id)
+    if not ride:
+        return HTMLResponse("Ride not found", status_code=404)
 
-@app.get("/horse/{horse_id}", response_class=HTMLResponse)
-def horse_detail(request: Request, horse_id: int):
-    with get_session() as s:
-        horse = s.get(Horse, horse_id)
-        if not horse:
-            return HTMLResponse("Kůň nenalezen", status_code=404)
-        rides = s.exec(
-            select(Ride).where(Ride.horse_id == horse_id).order_by(Ride.ride_date.desc())
-        ).all()
-
-    stats = {
-        "count": len(rides),
-        "km": sum(r.distance_km for r in rides),
-        "avg": (sum(r.avg_speed_kmh for r in rides) / len(rides)) if rides else 0,
-        "max": max((r.max_speed_kmh for r in rides), default=0),
-    }
+    if ride.gpx_path.startswith("http"):
+        return RedirectResponse(ride.gpx_path)
+    if ride.gpx_path.startswith("s3://"):
+        r2 = r2_client()
+        if not r2: return HTMLResponse("Storage not configured", status_code=500)
+        _, _, bucket_key = ride.gpx_path.partition("s3://")
+        bkt, _, key = bucket_key.partition("/")
+        return RedirectResponse(presigned_get_url(r2, bkt, key))
 
-    monthly_rows, weekly_rows, yearly_rows = accum_periods(rides)
-    month_series = [{"label": m["period"], "km": m["km"]} for m in monthly_rows]
-    week_series = [{"label": w["period"], "km": w["km"]} for w in weekly_rows]
-    year_series = [{"label": y["period"], "km": y["km"]} for y in yearly_rows]
+    p = Path(ride.gpx_path)
+    # one stat, off the loop, handed to FileResponse (it would stat again otherwise)
+    try:
+        st = await run_in_threadpool(os.stat, p)
+    except FileNotFoundError:
+        return HTMLResponse("GPX soubor už není k dispozici.", status_code=404)
+    # stored files are never rewritten and named by a per-upload uuid -> the name is a strong
+    # ETag; revalidate every time (no max-age) since a deleted ride's id can come back
+    uid = p.name.partition(".")[0]
+    gz = p.suffix == ".gz"
+    send_gz = gz and "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"ETag": f'"{uid}.gz"' if send_gz else f'"{uid}"', "Cache-Control": "public, no-cache"}
+    if gz: headers["Vary"] = "Accept-Encoding"
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    if gz and not send_gz:
+        # client without gzip support: inflate on the fly
+        headers["Content-Disposition"] = f'attachment; filename="{uid}.gpx"'
+        return StreamingResponse(gunzip_chunks(p), media_type="application/gpx+xml", headers=headers)
+    if send_gz:
+        # the stored bytes are the response body; also keeps GZipMiddleware out of it
+        headers["Content-Encoding"] = "gzip"
+    resp = FileResponse(path=str(p), filename=f"{uid}.gpx", media_type="application/gpx+xml", headers=headers, stat_result=st)
+    # uvicorn has no sendfile/pathsend, every chunk is a threadpool read: 1MB instead of 64KB
+    resp.chunk_size = 1 << 20
+    return resp
+
+async def gunzip_chunks(p: Path):
+    f = await run_in_threadpool(gzip.open, p, "rb")
+    try:
+        while chunk := await run_in_threadpool(f.read, 1 << 20):
+            yield chunk
+    finally:
+        await run_in_threadpool(f.close)
 
-    top_long = sorted(rides, key=lambda r: r.distance_km, reverse=True)[:3]
-    top_fast = sorted(rides, key=lambda r: r.max_speed_kmh, reverse=True)[:3]
-    top_climb = sorted(rides, key=lambda r: r.ascent_m, reverse=True)[:3]
+@app.get("/horse/{horse_id}", response_class=HTMLResponse)
+async def horse_detail(request: Request, horse_id: int, s: AsyncSession = Depends(get_session)):
+    horse = await s.get(Horse, horse_id)
+    if not horse:
+        return HTMLResponse("Kůň nenalezen", status_code=404)
+    # table rows: just the rendered columns as plain Row tuples, no Ride objects
+    rides = (await s.exec(
+        select(Ride.id, Ride.ride_date, Ride.title, Ride.distance_km, Ride.avg_speed_kmh, Ride.max_speed_kmh)
+        .where(Ride.horse_id == horse_id).order_by(Ride.ride_date.desc(), Ride.id.desc())
+    )).all()
+
+    count, km, avg, vmax = (await s.exec(
+        select(
+            func.count(Ride.id),
+            func.coalesce(func.sum(Ride.distance_km), 0),
+            func.coalesce(func.avg(Ride.avg_speed_kmh), 0),
+            func.coalesce(func.max(Ride.max_speed_kmh), 0),
+        ).where(Ride.horse_id == horse_id)
+    )).one()
+    stats = {"count": count, "km": km, "avg": avg, "max": vmax}
+
+    monthly_rows, weekly_rows, yearly_rows = await cached_period_rows(s, horse_id)
+    # JSON for the chart scripts (not Python repr: None/quotes would break the JS)
+    series = lambda rows: orjson.dumps([{"label": r["period"], "km": r["km"]} for r in rows]).decode()
+    month_series, week_series, year_series = series(monthly_rows), series(weekly_rows), series(yearly_rows)
 
     return templates.TemplateResponse("horse_detail.html", {
         "request": request, "horse": horse, "rides": rides,
         "monthly": monthly_rows, "weekly": weekly_rows, "yearly": yearly_rows,
         "month_series": month_series, "week_series": week_series, "year_series": year_series,
         "stats": stats,
-        "top_long": top_long, "top_fast": top_fast, "top_climb": top_climb,
         "q_from": None, "q_to": None,
     })
 
 # ---- Horses management ----
 @app.get("/horses", response_class=HTMLResponse)
-def horses_page(request: Request):
-    with get_session() as s:
-        horses = s.exec(select(Horse).options(selectinload(Horse.rides)).order_by(Horse.name)).all()
+async def horses_page(request: Request, s: AsyncSession = Depends(get_session)):
+    # (horse, rides count, km total, max km/h, last ride date) rows; no Ride objects loaded
+    horses = (await s.exec(
+        select(Horse, func.count(Ride.id), func.coalesce(func.sum(Ride.distance_km), 0),
+               func.max(Ride.max_speed_kmh), func.max(Ride.ride_date))
+        .outerjoin(Ride, Ride.horse_id == Horse.id)
+        .group_by(Horse.id)
+        .order_by(Horse.name)
+    )).all()
     return templates.TemplateResponse("horses.html", {"request": request, "horses": horses})
 
 @app.post("/horses/new")
-def create_horse(name: str = Form(...), notes: str = Form(default="")):
-    with get_session() as s:
-        if s.exec(select(Horse).where(Horse.name == name.strip())).first():
-            return RedirectResponse("/horses", status_code=303)
-        h = Horse(name=name.strip(), notes=(notes.strip() or None))
-        s.add(h); s.commit()
+async def create_horse(name: str = Form(...), notes: str = Form(default=""),
+                       s: AsyncSession = Depends(get_session)):
+    if (await s.exec(select(Horse).where(Horse.name == name.strip()))).first():
+        return RedirectResponse("/horses", status_code=303)
+    h = Horse(name=name.strip(), notes=(notes.strip() or None))
+    s.add(h)
+    try:
+        await s.commit()
+    except IntegrityError:
+        # a concurrent create got the name first -> same outcome as the check above
+        await s.rollback()
     return RedirectResponse("/horses", status_code=303)
 
 @app.post("/horse/{horse_id}/update")
-def update_horse(horse_id: int, name: str = Form(...), notes: str = Form(default=""),
-                 walk_trot_kmh: float | None = Form(default=None),
-                 trot_canter_kmh: float | None = Form(default=None)):
-    with get_session() as s:
-        h = s.get(Horse, horse_id)
-        if not h: raise HTTPException(404, "Kůň nenalezen")
-        h.name = name.strip()
-        h.notes = notes.strip() or None
-        h.walk_trot_kmh = walk_trot_kmh
-        h.trot_canter_kmh = trot_canter_kmh
-        s.add(h); s.commit()
+async def update_horse(horse_id: int, name: str = Form(...), notes: str = Form(default=""),
+                       walk_trot_kmh: float | None = Form(default=None),
+                       trot_canter_kmh: float | None = Form(default=None),
+                       s: AsyncSession = Depends(get_session)):
+    # one UPDATE, no SELECT first; rowcount 0 = no such horse
+    try:
+        res = await s.exec(update(Horse).where(Horse.id == horse_id).values(
+            name=name.strip(), notes=notes.strip() or None,
+            walk_trot_kmh=walk_trot_kmh, trot_canter_kmh=trot_canter_kmh))
+    except IntegrityError:
+        # unique index on Horse.name: the name belongs to another horse
+        await s.rollback()
+        raise HTTPException(409, "Kůň s tímto jménem už existuje")
+    if not res.rowcount: raise HTTPException(404, "Kůň nenalezen")
+    await s.commit()
     return RedirectResponse("/horses", status_code=303)
 
 @app.post("/horse/{horse_id}/delete")
-def delete_horse(horse_id: int):
-    with get_session() as s:
-        h = s.get(Horse, horse_id)
-        if not h: raise HTTPException(404, "Kůň nenalezen")
-        rides = s.exec(select(Ride).where(Ride.horse_id == horse_id)).all()
-        for r in rides:
-            r.horse_id = None
-            s.add(r)
-        s.delete(h); s.commit()
+async def delete_horse(horse_id: int, s: AsyncSession = Depends(get_session)):
+    h = await s.get(Horse, horse_id)
+    if not h: raise HTTPException(404, "Kůň nenalezen")
+    # jízdy zůstanou, jen se odpojí: one UPDATE + one DELETE in the same transaction
+    await s.exec(update(Ride).where(Ride.horse_id == horse_id).values(horse_id=None))
+    await s.exec(delete(Horse).where(Horse.id == horse_id))
+    await s.commit()
+    rides_changed()
     return RedirectResponse("/horses", status_code=303)
 
 @app.get("/backup.zip")
-def backup_zip():
-    with get_session() as s:
-        horses = s.exec(select(Horse).order_by(Horse.id)).all()
-        rides = s.exec(select(Ride).order_by(Ride.id)).all()
-    mem = io.BytesIO()
-    with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as z:
-        hout = io.StringIO(); w = csv.writer(hout)
-        w.writerow(["id","name","walk_trot_kmh","trot_canter_kmh","notes"])
-        for h in horses: w.writerow([h.id,h.name,h.walk_trot_kmh or "", h.trot_canter_kmh or "", h.notes or ""])
-        z.writestr("horses.csv", hout.getvalue())
-        rout = io.StringIO(); w = csv.writer(rout)
-        w.writerow(["id","date","title","horse_id","distance_km","avg_speed_kmh","max_speed_kmh","ascent_m","descent_m","gpx_path"])
-        for r in rides:
-            w.writerow([r.id,r.ride_date.isoformat(),r.title or "", r.horse_id or "", r.distance_km, r.avg_speed_kmh, r.max_speed_kmh, r.ascent_m, r.descent_m, r.gpx_path])
-        z.writestr("rides.csv", rout.getvalue())
-    mem.seek(0)
+async def backup_zip():
+    # already deflated, SkipGZip leaves it alone
     headers = {"Content-Disposition": 'attachment; filename="backup.zip"'}
-    return StreamingResponse(iter([mem.read()]), media_type="application/zip", headers=headers)
+    return StreamingResponse(backup_chunks(), media_type="application/zip", headers=headers)
@@ -1,14 +1,57 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import List, Tuple, Optional
-import math, gpxpy
+from typing import Optional
+import gzip, io, math, os
+from array import array
+import numpy as np
+from lxml import etree
 
-def hav_m(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    dlat = math.radians(lat2-lat1); dlon = math.radians(lon2-lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1))*math.cos(math.radians(lat2))*math.sin(dlon/2)**2
-    return 2*R*math.asin(math.sqrt(a))
+def segment_distances_m(lat, lon):
+    # all consecutive point pairs at once -> array of len(lat)-1; equirectangular (one cos, no asin);
+    # dlon wrapped to [-180, 180) so a step across the antimeridian stays short
+    dlon = (np.diff(lon)+180.0) % 360.0 - 180.0
+    x = np.radians(dlon)*np.cos(np.radians((lat[1:]+lat[:-1])*0.5))
+    return 6371000.0*np.hypot(x, np.radians(np.diff(lat)))
+
+def simplify_mask(lat, lon, eps_m: float = 5.0):
+    # Ramer-Douglas-Peucker on a local equirectangular projection (m);
+    # True = point needed to stay within eps_m of the full track
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n < 3:
+        keep[:] = True
+        return keep
+    y = np.radians(lat)*6371000.0
+    x = np.radians(lon)*6371000.0*math.cos(math.radians(float(np.mean(lat))))
+    keep[0] = keep[-1] = True
+    stack = [(0, n-1)]
+    while stack:
+        a, b = stack.pop()
+        if b-a < 2:
+            continue
+        dx, dy = x[b]-x[a], y[b]-y[a]
+        px, py = x[a+1:b]-x[a], y[a+1:b]-y[a]
+        norm = math.hypot(dx, dy)
+        dist = np.abs(dx*py - dy*px)/norm if norm > 0 else np.hypot(px, py)
+        i = int(np.argmax(dist))
+        if dist[i] > eps_m:
+            m = a+1+i
+            keep[m] = True
+            stack += [(a, m), (m, b)]
+    return keep
+
+def minmax_indices(y, buckets: int):
+    # chart decimation: min and max point of each of `buckets` equal slices, in order
+    # (a plain stride would skip the speed peaks); short series come back whole
+    n = len(y)
+    if n <= 2*buckets:
+        return np.arange(n)
+    size = -(-n // buckets); rows = -(-n // size); pad = rows*size - n
+    lo = np.append(y, np.full(pad, np.inf)).reshape(rows, size).argmin(axis=1)
+    hi = np.append(y, np.full(pad, -np.inf)).reshape(rows, size).argmax(axis=1)
+    base = np.arange(rows)*size
+    return np.union1d(np.union1d(base+lo, base+hi), (0, n-1))
 
 @dataclass
 class Metrics:
@@ -23,46 +66,99 @@ class Metrics:
     min_elev_m: Optional[float]
     max_elev_m: Optional[float]
     start_time: Optional[datetime]
-    speed_series: List[Tuple[Optional[datetime], float]]
-    elev_profile: List[Tuple[float, float]]
+    # struct-of-arrays series, one entry per point pair (i-1, i)
+    speed_t: np.ndarray   # float64 epoch seconds of point i, NaN = no timestamp
+    speed_v: np.ndarray   # float32 m/s
+    elev_d: np.ndarray    # float32 cumulative distance in m
+    elev_e: np.ndarray    # float32 elevation of point i in m
+    coords: np.ndarray    # (N, 3) float32 lat, lon, ele
 
-def parse_gpx_points(text: str):
-    g = gpxpy.parse(text)
-    pts = []
-    for trk in g.tracks:
-        for seg in trk.segments:
-            for p in seg.points:
-                t = p.time
-                if t and t.tzinfo is None:
-                    t = t.replace(tzinfo=timezone.utc)
-                pts.append((t, p.latitude, p.longitude, p.elevation or 0.0))
-    return pts
+def _parse_time(txt):
+    if not txt:
+        return None
+    try:
+        t = datetime.fromisoformat(txt.strip())
+    except ValueError:
+        return None
+    return t.replace(tzinfo=timezone.utc) if t.tzinfo is None else t
+
+@dataclass
+class TrackPoints:
+    # struct-of-arrays straight from the parser
+    t: np.ndarray      # float64 epoch seconds, NaN = no <time>
+    lat: np.ndarray
+    lon: np.ndarray
+    ele: np.ndarray    # missing/invalid <ele> -> 0.0
+    start: Optional[datetime]   # first point's time as written (keeps its UTC offset for ride_date)
 
-def compute_metrics(pts) -> Metrics:
-    if not pts:
-        return Metrics(0,0,0,0,0,0,0,None,None,None,[],[])
-    total_d=0; moving_d=0; moving_t=0; ascent=0; descent=0; max_v=0
-    min_e=pts[0][3]; max_e=pts[0][3]
-    start=pts[0][0]; end=pts[-1][0] if pts[-1][0] else start
-    speed_series=[]; elev_profile=[]; acc_d=0
-    for i in range(1,len(pts)):
-        t1,lat1,lon1,e1 = pts[i-1]
-        t2,lat2,lon2,e2 = pts[i]
-        dt = (t2-t1).total_seconds() if (t1 and t2) else 1.0
-        if dt<=0: dt=1.0
-        d = hav_m(lat1,lon1,lat2,lon2)
-        total_d += d; acc_d += d
-        v = d/dt; max_v=max(max_v,v)
-        if v > 1.0:
-            moving_d += d
-            moving_t += dt
-        speed_series.append((t2,v))
-        elev_profile.append((acc_d, e2))
-        de = e2-e1
-        if de>0: ascent+=de
-        else: descent+=-de
-        min_e=min(min_e,e2); max_e=max(max_e,e2)
-    total_t = int((end-start).total_seconds()) if (start and end) else 0
+    def __len__(self):
+        return len(self.lat)
+
+def parse_gpx_points(source) -> TrackPoints:
+    # source: GPX as str/bytes or a binary file object; streamed trkpt by trkpt
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    ts = array("d"); lats = array("d"); lons = array("d"); eles = array("d"); start = None
+    # uploaded XML: no DTD, no entity expansion (XXE / billion laughs), no network, default size limits
+    for _, el in etree.iterparse(source, events=("end",), tag="{*}trkpt",
+                                 resolve_entities=False, no_network=True, load_dtd=False):
+        # one pass over the few children instead of two wildcard find() calls (~2x faster)
+        ele_txt = time_txt = None
+        for ch in el:
+            tag = ch.tag
+            if not isinstance(tag, str):   # comments / PIs
+                continue
+            name = tag.rpartition("}")[2]
+            if name == "ele":
+                if ele_txt is None: ele_txt = ch.text or ""
+            elif name == "time" and time_txt is None:
+                time_txt = ch.text or ""
+        try:
+            e = float(ele_txt) if ele_txt else 0.0
+        except ValueError:
+            e = 0.0
+        t = _parse_time(time_txt)
+        if not lats:
+            start = t
+        ts.append(t.timestamp() if t else math.nan)
+        lats.append(float(el.get("lat"))); lons.append(float(el.get("lon"))); eles.append(e)
+        # drop the processed point (and already-finished siblings) to keep memory flat
+        el.clear(keep_tail=True)
+        while el.getprevious() is not None:
+            del el.getparent()[0]
+    arr = lambda a: np.frombuffer(a, dtype=np.float64) if a else np.empty(0)
+    return TrackPoints(arr(ts), arr(lats), arr(lons), arr(eles), start)
+
+def compute_metrics(pts: TrackPoints) -> Metrics:
+    if not len(pts):
+        empty = np.empty(0, dtype=np.float32)
+        return Metrics(0,0,0,0,0,0,0,0,None,None,None,np.empty(0),empty,empty,empty,np.empty((0, 3), dtype=np.float32))
+    d = segment_distances_m(pts.lat, pts.lon)
+    dt = np.diff(pts.t)
+    dt = np.where(dt > 0, dt, 1.0)   # also catches NaN (missing time)
+    v = d/dt
+    moving = v > 1.0
+    acc_d = np.cumsum(d)
+    total_d = float(acc_d[-1]) if len(acc_d) else 0.0
+    max_v = float(v.max(initial=0.0))
+    moving_d = float(d[moving].sum()); moving_t = float(dt[moving].sum())
+    de = np.diff(pts.ele)
+    # clamp instead of boolean-mask gathers: two straight SIMD sweeps, no temporaries of unknown size
+    ascent = float(np.maximum(de, 0.0).sum()); descent = float(-np.minimum(de, 0.0).sum())
+    start = float(pts.t[0]); end = float(pts.t[-1]) if not math.isnan(pts.t[-1]) else start
+    total_t = 0 if math.isnan(start) else int(end-start)
     avg = (total_d/total_t) if total_t>0 else 0.0
     avg_mv = (moving_d/moving_t) if moving_t>0 else 0.0
-    return Metrics(total_d,total_t,int(moving_t),avg,avg_mv,max_v,ascent,descent,min_e,max_e,start,speed_series,elev_profile)
+    coords = np.column_stack((pts.lat, pts.lon, pts.ele)).astype(np.float32)
+    return Metrics(total_d,total_t,int(moving_t),avg,avg_mv,max_v,ascent,descent,float(pts.ele.min()),float(pts.ele.max()),pts.start,
+                   pts.t[1:],v.astype(np.float32),acc_d.astype(np.float32),pts.ele[1:].astype(np.float32),coords)
+
+def analyze_gpx(source) -> Metrics:
+    # top-level (picklable) entry point for the process pool; source is a
+    # local Path (opened in the worker, .gz inflated on the fly) or the raw GPX bytes
+    if isinstance(source, os.PathLike):
+        with (gzip.open if os.fspath(source).endswith(".gz") else open)(source, "rb") as f:
+            return compute_metrics(parse_gpx_points(f))
+    return compute_metrics(parse_gpx_points(source))
@@ -1,10 +1,11 @@
 from typing import Optional, List
 from datetime import date, datetime
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 class Horse(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str
+    name: str = Field(index=True, unique=True)
     # Prahy mohou být nevyplněné -> None
     walk_trot_kmh: Optional[float] = Field(default=None)
     trot_canter_kmh: Optional[float] = Field(default=None)
@@ -12,6 +13,12 @@ class Horse(SQLModel, table=True):
     rides: List['Ride'] = Relationship(back_populates='horse')
 
 class Ride(SQLModel, table=True):
+    __table_args__ = (
+        # "/" orders by (ride_date, id), horse detail filters horse_id + orders by ride_date
+        Index("ix_ride_date_id", "ride_date", "id"),
+        Index("ix_ride_horse_date", "horse_id", "ride_date"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: Optional[str] = None
     ride_date: date
@@ -31,4 +38,6 @@ class Ride(SQLModel, table=True):
     max_elev_m: Optional[float] = None
 
     gpx_path: str
+    # gzip+orjson: speed_ts / elev_profile / coords pro detail jízdy
+    metrics_json: Optional[bytes] = None
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
@@ -0,0 +1,17 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db, main
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # fresh SQLite file + GPX dir per test; the engine and the parse pool are per-process singletons
+    monkeypatch.setenv("DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(db, "_engine", None)
+    monkeypatch.setattr(main, "DATA_DIR", tmp_path)
+    with TestClient(main.app) as c:
+        c.db_path = tmp_path / "test.db"
+        yield c
+    main.gpx_pool.cache_clear()
+
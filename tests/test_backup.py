@@ -0,0 +1,34 @@
+import gzip
+import io
+import zipfile
+
+from app import db, main
+
+GPX = (
+    '<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>'
+    + "".join(f'<trkpt lat="{50 + i*1e-4:.4f}" lon="14.0"><time>2025-03-01T10:00:{i:02d}Z</time></trkpt>'
+              for i in range(30))
+    + '</trkseg></trk></gpx>'
+).encode()
+
+
+def test_backup_streams_gpx_files_after_the_session_is_closed(client, monkeypatch):
+    r = client.post("/upload", files={"file": ("a.gpx", GPX, "application/gpx+xml")},
+                    data={"horse_name": "Bára", "ride_title": "t", "ride_date": ""}, follow_redirects=False)
+    assert r.status_code == 303
+
+    checked_out, gzip_open = [], gzip.open
+
+    def spy(*args, **kwargs):
+        checked_out.append(db.get_engine().pool.checkedout())
+        return gzip_open(*args, **kwargs)
+
+    monkeypatch.setattr(main.gzip, "open", spy)
+    r = client.get("/backup.zip")
+    assert r.status_code == 200
+    z = zipfile.ZipFile(io.BytesIO(r.content))
+    assert z.namelist() == ["horses.csv", "rides.csv", "gpx/1.gpx"]
+    assert z.read("gpx/1.gpx") == GPX
+    assert "Bára" in z.read("horses.csv").decode()
+    # the local .gpx.gz was opened with no DB connection checked out
+    assert checked_out == [0]
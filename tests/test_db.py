@@ -0,0 +1,47 @@
+import asyncio
+import sqlite3
+
+from app import db
+
+
+def test_schema_hash_not_stored_while_an_index_is_skipped(tmp_path, monkeypatch):
+    path = tmp_path / "old.db"
+    monkeypatch.setenv("DATABASE_URL", f"sqlite+aiosqlite:///{path}")
+    monkeypatch.setattr(db, "_engine", None)
+    # a database from before the unique horse name index, with a duplicate name
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE horse (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+                     "walk_trot_kmh FLOAT, trot_canter_kmh FLOAT, notes VARCHAR)")
+        conn.executemany("INSERT INTO horse (name, walk_trot_kmh, trot_canter_kmh) VALUES (?, NULL, NULL)",
+                         [("Bára",), ("Bára",)])
+
+    def stored():
+        with sqlite3.connect(path) as conn:
+            return conn.execute("SELECT v FROM _schema").fetchall()
+
+    async def init():
+        await db.init_db()
+        await db.get_engine().dispose()
+
+    asyncio.run(init())
+    assert stored() == []
+
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE horse SET name = 'Bára 2' WHERE id = 2")
+    asyncio.run(init())
+    assert stored() == [(db.schema_hash(),)]
+
+
+def test_pgbouncer_url(monkeypatch):
+    calls = []
+    monkeypatch.setattr(db, "create_async_engine", lambda url, **kw: calls.append((url, kw)))
+    monkeypatch.setenv("DATABASE_URL", "postgres://u:p@db.example:6432/gpx?pgbouncer=true&sslmode=require")
+    db._build_engine()
+    monkeypatch.setenv("DATABASE_URL", "postgresql://u:p@db.example/gpx")
+    db._build_engine()
+    (bouncer, kw), (direct, kw_direct) = calls
+    assert bouncer.drivername == "postgresql+asyncpg" and "pgbouncer" not in bouncer.query
+    assert bouncer.query["sslmode"] == "require" and bouncer.query["prepared_statement_cache_size"] == "0"
+    assert kw["connect_args"]["statement_cache_size"] == 0 and not kw["pool_pre_ping"]
+    assert kw["connect_args"]["prepared_statement_name_func"]() != kw["connect_args"]["prepared_statement_name_func"]()
+    assert direct.query == {} and kw_direct["connect_args"] == {} and kw_direct["pool_pre_ping"]
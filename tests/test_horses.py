@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+# AsyncSession.execute is deprecated in sqlmodel; the handlers must go through exec()
+pytestmark = pytest.mark.filterwarnings(r"error:\s+.*session\.exec:DeprecationWarning")
+
+GPX = (
+    b'<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>'
+    b'<trkpt lat="50.0" lon="14.0"><time>2025-03-01T10:00:00Z</time></trkpt>'
+    b'<trkpt lat="50.001" lon="14.0"><time>2025-03-01T10:01:00Z</time></trkpt>'
+    b'</trkseg></trk></gpx>'
+)
+
+
+def query(client, sql):
+    with sqlite3.connect(client.db_path) as conn:
+        return conn.execute(sql).fetchall()
+
+
+def test_update_horse(client):
+    for name in ("Bára", "Dora"):
+        assert client.post("/horses/new", data={"name": name}, follow_redirects=False).status_code == 303
+    form = {"name": "Bára 2", "notes": "", "walk_trot_kmh": "7", "trot_canter_kmh": "14"}
+    assert client.post("/horse/1/update", data=form, follow_redirects=False).status_code == 303
+    assert query(client, "SELECT name, walk_trot_kmh, trot_canter_kmh FROM horse WHERE id = 1") == [("Bára 2", 7, 14)]
+    assert client.post("/horse/1/update", data={**form, "name": "Dora"}).status_code == 409
+    assert client.post("/horse/9/update", data=form).status_code == 404
+
+
+def test_delete_horse_keeps_its_rides(client):
+    r = client.post("/upload", files={"file": ("a.gpx", GPX, "application/gpx+xml")},
+                    data={"horse_name": "Bára", "ride_title": "t", "ride_date": ""}, follow_redirects=False)
+    assert r.status_code == 303
+    assert query(client, "SELECT horse_id FROM ride") == [(1,)]
+    assert client.post("/horse/1/delete", follow_redirects=False).status_code == 303
+    assert query(client, "SELECT horse_id FROM ride") == [(None,)]
+    assert query(client, "SELECT id FROM horse") == []
+    assert client.post("/horse/1/delete").status_code == 404
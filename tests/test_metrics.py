@@ -0,0 +1,41 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.metrics import segment_distances_m
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2-lat1); dlon = math.radians(lon2-lon1)
+    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1))*math.cos(math.radians(lat2))*math.sin(dlon/2)**2
+    return 2*6371000.0*math.asin(math.sqrt(a))
+
+
+def walk(lat0, lon0, n=2000, step_deg=0.0003, seed=1):
+    # GPS-like random walk (~1-30 m per point) with a few ~1 km gaps (signal loss)
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, step_deg/3, (n-1, 2))
+    steps[::250] *= 40
+    lat = lat0 + np.concatenate(([0.0], np.cumsum(steps[:, 0])))
+    lon = lon0 + np.concatenate(([0.0], np.cumsum(steps[:, 1])))
+    return lat, (lon+180.0) % 360.0 - 180.0
+
+
+@pytest.mark.parametrize("lat0, lon0", [(50.08, 14.42), (-33.9, 18.4), (64.1, -21.9), (-16.5, 179.999)])
+def test_segment_distances_match_haversine(lat0, lon0):
+    lat, lon = walk(lat0, lon0)
+    d = segment_distances_m(lat, lon)
+    ref = np.array([haversine_m(lat[i], lon[i], lat[i+1], lon[i+1]) for i in range(len(lat)-1)])
+    assert len(d) == len(ref)
+    assert np.all(np.abs(d-ref) <= 1e-4*ref + 1e-6)   # < 0.01 % per segment
+    assert abs(d.sum()-ref.sum()) < 1e-4*ref.sum()
+
+
+def test_segment_distances_across_antimeridian():
+    lat = np.array([-16.5, -16.5, -16.5])
+    lon = np.array([179.9999, -179.9999, 179.9999])
+    d = segment_distances_m(lat, lon)
+    ref = haversine_m(-16.5, 179.9999, -16.5, -179.9999)
+    assert ref < 25
+    assert np.allclose(d, ref, rtol=1e-4)
@@ -0,0 +1,56 @@
+import sqlite3
+
+import httpx
+
+from app import main
+
+
+def upload(client, body, name="a.gpx"):
+    return client.post("/upload", files={"file": (name, body, "application/gpx+xml")},
+                       data={"horse_name": "", "ride_title": "t", "ride_date": "2025-03-01"},
+                       follow_redirects=False)
+
+
+def test_upload_does_not_resolve_entities(client, tmp_path):
+    secret = tmp_path / "secret.txt"
+    secret.write_text("900")
+    body = (
+        '<?xml version="1.0"?>'
+        f'<!DOCTYPE gpx [<!ENTITY xxe SYSTEM "file://{secret}"><!ENTITY big "555">]>'
+        '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>'
+        '<trkpt lat="50.0" lon="14.0"><ele>100</ele><time>2025-03-01T10:00:00Z</time></trkpt>'
+        '<trkpt lat="50.001" lon="14.0"><ele>&xxe;</ele><time>2025-03-01T10:01:00Z</time></trkpt>'
+        '<trkpt lat="50.002" lon="14.0"><ele>&big;</ele><time>2025-03-01T10:02:00Z</time></trkpt>'
+        '</trkseg></trk></gpx>'
+    ).encode()
+    r = upload(client, body)
+    assert r.status_code == 303
+    with sqlite3.connect(client.db_path) as conn:
+        ascent, descent = conn.execute("SELECT ascent_m, descent_m FROM ride").fetchone()
+    # unresolved entities leave <ele> empty (0 m); neither 900 from the file nor 555 got in
+    assert (ascent, descent) == (0, 100)
+
+
+def test_remote_gpx_is_spooled_to_a_temp_file(client, tmp_path, monkeypatch):
+    body = (
+        '<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>'
+        + "".join(f'<trkpt lat="{50 + i*1e-4:.4f}" lon="14.0"><time>2025-03-01T10:00:{i:02d}Z</time></trkpt>'
+                  for i in range(30))
+        + '</trkseg></trk></gpx>'
+    ).encode()
+    sources = []
+    analyze_in_pool = main.analyze_in_pool
+
+    async def spy(source):
+        sources.append(source)
+        return await analyze_in_pool(source)
+
+    handler = lambda request: httpx.Response(200 if request.url.path == "/a.gpx" else 404, content=body)
+    monkeypatch.setattr(main, "HTTP", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "analyze_in_pool", spy)
+    m = client.portal.call(main.load_gpx_metrics, "https://gpx.example/a.gpx")
+    assert len(m.coords) == 30 and 300 < m.distance_m < 340
+    # the pool got a path to the spooled body, not the bytes; the file is gone afterwards
+    assert [s.suffix for s in sources] == [".part"]
+    assert client.portal.call(main.load_gpx_metrics, "https://gpx.example/gone.gpx") is None
+    assert not list(tmp_path.glob("*.part"))